@@ -1,6 +1,30 @@
-import xml.etree.ElementTree as ET
-import collections
-import json
+# lxml's libxml2-backed iterparse is 2-4x faster than the stdlib on the
+# tag-heavy instance documents this module processes. The APIs we use
+# (iterparse, .find, .get, .tag, .clear) are drop-in compatible, so fall
+# back to the stdlib when lxml isn't installed.
+import sys
+from operator import itemgetter
+
+try:
+    from lxml import etree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+# Real XBRL facts live in taxonomy namespaces (us-gaap, dei, the filer's
+# own extension), never in the structural ones below. Knowing that lets
+# the ingestion loop skip structural elements (units, schema refs,
+# footnote links...) before probing their attributes at all.
+_STRUCTURAL_PREFIXES = frozenset((
+    'link', 'xlink', 'xbrli', 'xbrldi', 'xsi', 'iso4217', 'utr', 'xhtml',
+))
+_STRUCTURAL_URIS = frozenset((
+    'http://www.xbrl.org/2003/linkbase',
+    'http://www.w3.org/1999/xlink',
+    'http://www.xbrl.org/2003/instance',
+    'http://xbrl.org/2006/xbrldi',
+    'http://www.w3.org/2001/XMLSchema-instance',
+    'http://www.xbrl.org/2003/iso4217',
+))
 
 
 class HtmParser:
@@ -15,110 +39,241 @@ class HtmParser:
         print(f"  [HtmParser] Initializing and loading data from {htm_path.name}...")
         self.ns = namespaces
 
+        # Reverse map (URI -> prefix) for O(1) lookups in _find_prefix.
+        # The old linear scan over self.ns.items() ran once per fact element,
+        # i.e. thousands of times per filing. Kept in sync as 'start-ns'
+        # events arrive below.
+        self._uri_to_prefix = {uri: prefix for prefix, uri in self.ns.items()}
+
         # self.contexts stores: {context_id: {'type': '...', 'date': '...'}}
         self.contexts = {}
 
-        # self.values stores a rich dictionary:
-        # {concept: {context_id: {'value': '...', 'decimals': '...', 'scale': '...'}}}
-        # This structure is a nested defaultdict:
-        # 1. Key: concept (e.g., "us-gaap_Assets")
-        # 2. Key: context_id (e.g., "c-1")
-        # 3. Value: The data object {'value': ..., 'scale': ...}
-        self.values = collections.defaultdict(lambda: collections.defaultdict(dict))
-        self.value_concepts_loaded = set() # Just for logging
-
-        tree_htm = ET.parse(htm_path)
-        root_htm = tree_htm.getroot()
-        # Find the xbrli namespace URI, which is critical for parsing <context>
-        # Fallback to 'default' if 'xbrli' isn't explicitly prefixed.
-        xbrli_uri = self.ns.get('xbrli', self.ns.get('default'))
-
-        # 1. Parse <context> elements
-        for context in root_htm.iter('{' + xbrli_uri + '}context'):
-            context_id = context.get('id')
-            period_elem = context.find('.//{' + xbrli_uri + '}period')
-            if context_id and period_elem is not None:
-                # Find 'instant' (for balance sheet)
-                instant = period_elem.find('{' + xbrli_uri + '}instant')
-                # Find 'endDate' (for income statement/cash flow)
-                end_date = period_elem.find('{' + xbrli_uri + '}endDate')
-                start_date = period_elem.find('{' + xbrli_uri + '}startDate')
-
-                if instant is not None:
-                    # This is a "point in time" context
-                    self.contexts[context_id] = {
-                        'type': 'instant',
-                        'date': instant.text
-                    }
-                elif end_date is not None:
-                    # This is a "duration" context
-                    self.contexts[context_id] = {
-                        'type': 'duration',
-                        'date': end_date.text,
-                        'start': start_date.text if start_date is not None else 'N/A'
-                    }
+        # Facts are stored column-wise (struct-of-arrays): three parallel
+        # dicts sharing (concept, context_id) keys, one per field.
+        # A 3-field dict per cell cost ~hundreds of bytes each across
+        # thousands of facts; three flat dicts keep one small object per
+        # field instead of one dict object per cell.
+        self._fact_value = {}     # (concept, ctx) -> value string
+        self._fact_decimals = {}  # (concept, ctx) -> decimals attribute
+        self._fact_scale = {}     # (concept, ctx) -> scale attribute
+        # concept -> first (concept, ctx) key seen for it, so per-concept
+        # lookups stay O(1) instead of scanning every fact key.
+        self._first_fact_key = {}
 
-        print(f"  [HtmParser] Loaded {len(self.contexts)} contexts.")
+        # The xbrli namespace URI is critical for parsing <context>, but we
+        # only learn it from the file's own 'start-ns' events below (it is
+        # often the 'default' namespace of the HTM file). Resolved lazily
+        # once the root element's declarations have been seen.
+        xbrli_uri = None
+        context_tag = None
+        # Clark-notation search strings for the <context> subtree, built
+        # once alongside context_tag instead of re-concatenated per context.
+        period_path = instant_tag = end_date_tag = start_date_tag = None
+
+        # Stream the instance document with iterparse instead of building a
+        # full DOM with ET.parse(). Instance files can be tens of MB, and the
+        # old ET.parse + two root.iter() passes held the whole tree in memory
+        # and walked it twice. One streaming pass harvests namespaces,
+        # handles <context> elements and facts inline, then clears each
+        # element so peak memory stays bounded by tree depth, not document
+        # size.
+        root_htm = None
+        depth = 0
+        # Cache of tag -> prefixed concept name (or None for non-concept
+        # tags). The same tag recurs for every context a fact is reported
+        # in, so splitting and prefix-resolving it once is enough.
+        tag_to_concept = {}
+        # URIs whose elements can never be facts; grown from the file's own
+        # declarations as structural prefixes are encountered.
+        skip_uris = set(_STRUCTURAL_URIS)
+        for event, element in ET.iterparse(htm_path, events=('start-ns', 'start', 'end')):
+            if event == 'start-ns':
+                # Feed the shared namespace dict (owned by the orchestrator)
+                prefix, uri = element
+                self.ns[prefix if prefix else 'default'] = uri
+                self._uri_to_prefix[uri] = prefix if prefix else 'default'
+                if prefix in _STRUCTURAL_PREFIXES:
+                    skip_uris.add(uri)
+                continue
+
+            if event == 'start':
+                # Keep a handle on the root so we can drop processed
+                # (already-cleared) children and keep the tree shallow.
+                if root_htm is None:
+                    root_htm = element
+                depth += 1
+                continue
+
+            # --- 'end' events: the element and its subtree are complete ---
+            depth -= 1
+
+            # Only act on direct children of the root (contexts, facts,
+            # units). Anything deeper belongs to a subtree we still need
+            # intact (e.g., <period> inside an open <context>), so clearing
+            # it here would destroy data before its parent is handled.
+            if depth != 1:
+                continue
+
+            if context_tag is None:
+                # All of the root's xmlns declarations have been emitted by
+                # now, so the xbrli URI can be resolved. Fallback to
+                # 'default' if 'xbrli' isn't explicitly prefixed, then to
+                # the spec constant.
+                xbrli_uri = self.ns.get(
+                    'xbrli',
+                    self.ns.get('default', 'http://www.xbrl.org/2003/instance'))
+                context_tag = '{' + xbrli_uri + '}context'
+                period_path = './/{' + xbrli_uri + '}period'
+                instant_tag = '{' + xbrli_uri + '}instant'
+                end_date_tag = '{' + xbrli_uri + '}endDate'
+                start_date_tag = '{' + xbrli_uri + '}startDate'
+
+            if element.tag == context_tag:
+                # 1. Parse a <context> element
+                context_id = element.get('id')
+                period_elem = element.find(period_path)
+                if context_id and period_elem is not None:
+                    # Find 'instant' (for balance sheet)
+                    instant = period_elem.find(instant_tag)
+                    # Find 'endDate' (for income statement/cash flow)
+                    end_date = period_elem.find(end_date_tag)
+                    start_date = period_elem.find(start_date_tag)
+
+                    if instant is not None:
+                        # This is a "point in time" context
+                        self.contexts[context_id] = {
+                            'type': 'instant',
+                            'date': instant.text
+                        }
+                    elif end_date is not None:
+                        # This is a "duration" context
+                        self.contexts[context_id] = {
+                            'type': 'duration',
+                            'date': end_date.text,
+                            'start': start_date.text if start_date is not None else 'N/A'
+                        }
+                element.clear()
+                continue
+
+            # 2. Parse a data element (fact)
+            # Fast-reject elements that cannot be facts -- anything without
+            # a namespace or living in a structural namespace -- before
+            # paying for the attribute probe. (<context> was handled above,
+            # so skipping the rest of xbrli here is safe.)
+            tag = element.tag
+            if not isinstance(tag, str) or tag[0] != '{' \
+                    or tag[1:tag.index('}')] in skip_uris:
+                element.clear()
+                if root_htm is not None and len(root_htm):
+                    del root_htm[:]
+                continue
 
-        # 2. Parse all data elements (facts)
-        for element in root_htm.iter():
             context_ref = element.get('contextRef')
-            # Filter for elements that are facts (have a contextRef)
+            # Filter for elements that are facts (have a contextRef).
+            # Contexts always precede the facts that reference them.
             if context_ref and context_ref in self.contexts:
-                # Get the tag (e.g., "{http://fasb.org/us-gaap/2025}Assets")
-                tag_parts = element.tag.split('}')
-                if len(tag_parts) == 2:
-                    tag_uri = tag_parts[0].strip('{')
-                    tag_name = tag_parts[1]
-
-                    # Reverse-lookup the prefix (e.g., "us-gaap") from the URI
-                    concept_prefix = self._find_prefix(tag_uri)
-                    if concept_prefix:
-                        # Re-create the prefixed concept name
-                        concept_name = f"{concept_prefix}_{tag_name}"
-
-                        # Get scaling attributes. This is critical.
-                        value = element.text
-                        # Default to '0' (which means 10^0, or 1) if missing
-                        decimals = element.get('decimals', '0')
-                        scale = element.get('scale', '0')
-
-                        # Store the rich data object.
-                        # We MUST store scale/decimals alongside the value.
-                        self.values[concept_name][context_ref] = {
-                            'value': value,
-                            'decimals': decimals,
-                            'scale': scale
-                        }
-                        self.value_concepts_loaded.add(concept_name)
+                tag = element.tag
+                if tag in tag_to_concept:
+                    concept_name = tag_to_concept[tag]
+                else:
+                    # Split the tag once per unique tag
+                    # (e.g., "{http://fasb.org/us-gaap/2025}Assets")
+                    concept_name = None
+                    tag_parts = tag.split('}')
+                    if len(tag_parts) == 2:
+                        tag_uri = tag_parts[0].strip('{')
+                        tag_name = tag_parts[1]
+
+                        # Reverse-lookup the prefix (e.g., "us-gaap")
+                        concept_prefix = self._find_prefix(tag_uri)
+                        if concept_prefix:
+                            # Re-create the prefixed concept name. Interned:
+                            # the label/presentation parsers build identical
+                            # strings, so lookups get the pointer-equality
+                            # fast path instead of full string compares.
+                            concept_name = sys.intern(f"{concept_prefix}_{tag_name}")
+                    tag_to_concept[tag] = concept_name
+
+                if concept_name:
+                    # A few dozen unique context IDs recur across thousands
+                    # of facts; interning makes the tuple-key hashing cheap.
+                    context_ref = sys.intern(context_ref)
+
+                    # Get scaling attributes. This is critical.
+                    value = element.text
+                    # Default to '0' (which means 10^0, or 1) if missing
+                    decimals = element.get('decimals', '0')
+                    scale = element.get('scale', '0')
+
+                    # Store the three fields column-wise under a shared key.
+                    # We MUST store scale/decimals alongside the value.
+                    key = (concept_name, context_ref)
+                    self._fact_value[key] = value
+                    self._fact_decimals[key] = decimals
+                    self._fact_scale[key] = scale
+                    self._first_fact_key.setdefault(concept_name, key)
+
+            element.clear()
+            # Drop the (now empty) shells accumulating under the root so
+            # long documents don't grow the tree one node per fact.
+            if root_htm is not None and len(root_htm):
+                del root_htm[:]
+
+        print(f"  [HtmParser] Loaded {len(self.contexts)} contexts.")
+
+        # Pre-sorted (date, context_id) lists per context type, newest
+        # first. Contexts are immutable after init, so sorting once here
+        # saves every query the full scan+sort over self.contexts.
+        # Key on the date alone (not the whole tuple): the sort stays
+        # stable for equal dates, so document order still decides between
+        # same-date contexts, exactly like the old per-query sort did.
+        def _by_type(target_type):
+            pairs = [(info['date'], ctx_id)
+                     for ctx_id, info in self.contexts.items()
+                     if info['type'] == target_type]
+            pairs.sort(key=itemgetter(0), reverse=True)
+            return pairs
 
-        print(f"  [HtmParser] Loaded data for {len(self.value_concepts_loaded)} unique concepts.")
+        self._sorted_instant_ctxs = _by_type('instant')
+        self._sorted_duration_ctxs = _by_type('duration')
+
+        print(f"  [HtmParser] Loaded data for {len(self._first_fact_key)} unique concepts.")
+
+    def get_sorted_contexts(self, target_type):
+        """
+        Returns the pre-sorted (date, context_id) list for a context type
+        ('instant' or 'duration'), newest date first.
+        """
+        if target_type == 'instant':
+            return self._sorted_instant_ctxs
+        return self._sorted_duration_ctxs
 
     def _find_prefix(self, uri):
         """Helper to find the prefix (e.g., 'us-gaap') for a given namespace URI."""
-        for prefix, ns_uri in self.ns.items():
-            if ns_uri == uri:
-                return prefix
-        return None # No prefix found
+        return self._uri_to_prefix.get(uri)  # None if no prefix found
 
     def get_data(self, concept_list, context_ids):
         """
         The main data retrieval method.
         Returns all found data for a list of concepts and contexts.
+        Each cell is a (value, decimals, scale) tuple; missing cells get
+        the 'N/A' default so the scaling stage never sees a KeyError.
         """
         results = []
+        default_cell = ('N/A', '0', '0')
+        fact_value = self._fact_value
+        fact_decimals = self._fact_decimals
+        fact_scale = self._fact_scale
         for concept in concept_list:
             row_data = {'concept': concept}
-            # Get the map of {context_id: value_obj} for this concept
-            # Use .get() with a default empty dict to avoid errors
-            value_map = self.values.get(concept, {})
-
             for ctx_id in context_ids:
-                # Pass the *entire value object* or a default 'N/A' object
-                # This ensures the main parser always gets a valid object
-                # to pass to its scaling function, avoiding KeyError.
-                default_val = {'value': 'N/A', 'decimals': '0', 'scale': '0'}
-                row_data[ctx_id] = value_map.get(ctx_id, default_val)
+                key = (concept, ctx_id)
+                value = fact_value.get(key)
+                if value is None and key not in fact_value:
+                    row_data[ctx_id] = default_cell
+                else:
+                    row_data[ctx_id] = (
+                        value, fact_decimals[key], fact_scale[key])
 
             results.append(row_data)
         return results
@@ -136,12 +291,9 @@ class HtmParser:
         Fetches the first available value for a specific concept.
         (Mostly useful for debugging).
         """
-        value_map = self.values.get(concept_name)
-        if not value_map:
-            print(f"    ...[HtmParser] WARN: Concept '{concept_name}' not found in values.")
-            return None
-        try:
+        key = self._first_fact_key.get(concept_name)
+        if key is not None:
             # Return the first *value string*
-            return next(iter(value_map.values())).get('value')
-        except StopIteration:
-            return None
+            return self._fact_value[key]
+        print(f"    ...[HtmParser] WARN: Concept '{concept_name}' not found in values.")
+        return None
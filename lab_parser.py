@@ -1,4 +1,39 @@
-import xml.etree.ElementTree as ET
+import collections
+import re
+import sys
+
+# lxml's libxml2-backed parser tokenizes multi-MB linkbase files several
+# times faster than the stdlib ElementTree wrapper; the APIs used here
+# (iterparse, .iter, .get) are drop-in compatible. Fall back to the
+# stdlib when lxml isn't installed so the dependency stays optional.
+try:
+    from lxml import etree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+# The one label role we index; everything else ("verboseLabel",
+# "documentation", ...) is skipped. Module-level so the literal isn't
+# rebuilt per element and comparisons hit the interned-string fast path.
+_STANDARD_LABEL_ROLE = 'http://www.xbrl.org/2003/role/label'
+
+# Tokenizer for the inverted label index: lowercase alphanumeric runs,
+# so "Earnings per share, basic" -> ['earnings', 'per', 'share', 'basic'].
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def _charmask(text):
+    """
+    26-bit letter bitmap of a lowercase string (bit 0 = 'a').
+    A label can only contain a query as substrings if it contains at
+    least the query's letters, so comparing the two masks with one int
+    AND rejects most labels before any substring work.
+    """
+    mask = 0
+    for char in text:
+        code = ord(char)
+        if 97 <= code <= 122:  # 'a'..'z'
+            mask |= 1 << (code - 97)
+    return mask
 
 
 class LabelParser:
@@ -15,66 +50,154 @@ class LabelParser:
         self.label_to_concept = {}  # Search index (e.g., "assets" -> "us-gaap_Assets")
         self.concept_to_label = {}  # Lookup index (e.g., "us-gaap_Assets" -> "Assets")
 
-        tree_lab = ET.parse(lab_path)
-        root_lab = tree_lab.getroot()
+        # The _lab.xml file is a "linkbase". We have to resolve the same
+        # three relationships as ever (loc -> concept, label-id -> text,
+        # arc joins them), but in ONE streaming pass instead of a full
+        # ET.parse() DOM walked three times. Each element is cleared as
+        # soon as it has been read, so peak memory is the size of the
+        # index dicts, not the whole multi-MB tree.
 
-        # The _lab.xml file is a "linkbase". We have to resolve the relationships
-        # in three steps, as the data is heavily normalized:
-        
-        # 1. Map <loc> 'label' (e.g., "loc_1") to concept 'href' (e.g., "us-gaap_Assets")
+        # Namespaced tags/attributes, built once before the loop.
+        # Interned so the thousands of per-element dict probes they key
+        # get the pointer-equality fast path.
+        loc_tag = sys.intern('{' + self.ns['link'] + '}loc')
+        label_tag = sys.intern('{' + self.ns['link'] + '}label')
+        arc_tag = sys.intern('{' + self.ns['link'] + '}labelArc')
+        href_attr = sys.intern('{' + self.ns['xlink'] + '}href')
+        label_attr = sys.intern('{' + self.ns['xlink'] + '}label')
+        role_attr = sys.intern('{' + self.ns['xlink'] + '}role')
+        from_attr = sys.intern('{' + self.ns['xlink'] + '}from')
+        to_attr = sys.intern('{' + self.ns['xlink'] + '}to')
+
+        # 1+2. Map <loc> 'label' (e.g., "loc_1") to concept 'href'
+        # (e.g., "us-gaap_Assets") and <label> 'label' (e.g., "lab_1") to
+        # its text (e.g., "Assets").
         loc_to_concept = {}
-        # Find all <loc> elements using the 'link' namespace
-        for loc in root_lab.iter('{' + self.ns['link'] + '}loc'):
-            # Use .get() for attributes, including namespaced ones like 'xlink:href'
-            href = loc.get('{' + self.ns['xlink'] + '}href')
-            label = loc.get('{' + self.ns['xlink'] + '}label')
-            if href and '#' in href:
-                # The href contains the file path, we just want the concept ID
-                concept = href.split('#')[-1]  # "us-gaap_Assets"
-                loc_to_concept[label] = concept
-
-        # 2. Map <label> 'label' (e.g., "lab_1") to its text (e.g., "Assets")
         label_to_text = {}
-        for label in root_lab.iter('{' + self.ns['link'] + '}label'):
-            role = label.get('{' + self.ns['xlink'] + '}role')
-            label_id = label.get('{' + self.ns['xlink'] + '}label')
-            
-            # We only want the standard human-readable label.
-            # XBRL has other roles like "verboseLabel", "documentation", etc.
-            if role == 'http://www.xbrl.org/2003/role/label':
-                label_to_text[label_id] = label.text
-
-        # 3. Connect them using <labelArc>
-        # This arc maps "from" a <loc> "to" a <label>
-        for arc in root_lab.iter('{' + self.ns['link'] + '}labelArc'):
-            arc_from = arc.get('{' + self.ns['xlink'] + '}from') # e.g., "loc_1"
-            arc_to = arc.get('{' + self.ns['xlink'] + '}to')     # e.g., "lab_1"
-            
-            # Resolve the pointers from the maps built in steps 1 & 2
+        # Arcs are buffered and resolved after the stream ends; locs and
+        # labels usually precede the arcs that reference them, but the
+        # schema doesn't guarantee it.
+        arcs = []
+
+        for event, payload in ET.iterparse(lab_path, events=('start-ns', 'end')):
+            if event == 'start-ns':
+                # Harvest 'xmlns' declarations into the shared namespace
+                # dict as we go (no separate discovery pass).
+                prefix, uri = payload
+                self.ns[prefix if prefix else 'default'] = uri
+                continue
+
+            tag = payload.tag
+            if tag == loc_tag:
+                # Use .get() for attributes, including namespaced ones
+                # like 'xlink:href'
+                href = payload.get(href_attr)
+                label = payload.get(label_attr)
+                if href and '#' in href:
+                    # The href contains the file path, we just want the
+                    # concept ID (e.g., "us-gaap_Assets"). rpartition
+                    # returns the last piece without building a list.
+                    loc_to_concept[label] = href.rpartition('#')[2]
+            elif tag == label_tag:
+                # We only want the standard human-readable label.
+                # XBRL has other roles like "verboseLabel", "documentation".
+                if payload.get(role_attr) == _STANDARD_LABEL_ROLE:
+                    label_to_text[payload.get(label_attr)] = payload.text
+            elif tag == arc_tag:
+                # This arc maps "from" a <loc> "to" a <label>
+                arcs.append((payload.get(from_attr), payload.get(to_attr)))
+            # Done with this element; release its memory
+            payload.clear()
+
+        # 3. Connect locs and labels using the buffered <labelArc>s
+        for arc_from, arc_to in arcs:
+            # Resolve the pointers from the maps built during the stream
             concept = loc_to_concept.get(arc_from)
             text = label_to_text.get(arc_to)
-            
+
             if concept and text:
                 # Populate both of our indexes for fast O(1) lookups
                 self.label_to_concept[text.lower()] = concept
                 self.concept_to_label[concept] = text
+
+        # The intermediate maps are only needed for the join above
+        del loc_to_concept, label_to_text, arcs
+
+        # Inverted index: token -> set of concepts whose label contains it.
+        # Queries become a set intersection over posting lists instead of
+        # an O(labels x query words) substring scan.
+        self.token_index = collections.defaultdict(set)
+        # Letter bitmap per label, for quick rejection in the substring
+        # fallback scan (see _charmask).
+        self._label_charmask = {}
+        # Per-instance query -> result memo. A dict owned by the instance
+        # (rather than lru_cache on the method, which keys a class-level
+        # cache on self) dies with the parser instead of pinning it alive.
+        self._query_cache = {}
+        for label_text_lower, concept in self.label_to_concept.items():
+            for token in _TOKEN_RE.findall(label_text_lower):
+                self.token_index[token].add(concept)
+            self._label_charmask[label_text_lower] = _charmask(label_text_lower)
                 
+        # Public alias: callers on hot paths (e.g., CSV row assembly) can
+        # read this dict directly instead of paying a method call per row.
+        self.labels = self.concept_to_label
+
         print(f"  [LabelParser] Index built. {len(self.concept_to_label)} concepts loaded.")
 
     def find_concepts_by_query(self, query):
         """
         Returns a list of concept names that match the query words.
         This provides a robust "AND" search (e.g., "earnings per share").
+        Results are memoized per query string; the index never changes
+        after init, so repeat queries are O(1).
         """
+        cached = self._query_cache.get(query)
+        if cached is None:
+            cached = self._query_cache[query] = self._resolve_query(query)
+        return cached
+
+    def _resolve_query(self, query):
+        # Fast path: resolve each query word against the inverted index,
+        # unioning the posting sets of every indexed token that CONTAINS
+        # the word ('share' collects 'share' AND 'shares'), then
+        # intersecting across words. Labels are tokenized on
+        # non-alphanumeric characters, so an alphanumeric word is a
+        # substring of a label exactly when it is a substring of one of
+        # the label's tokens -- this reproduces the substring-"AND"
+        # semantics of the scan below while walking the (much smaller)
+        # token vocabulary instead of every label.
+        query_lower = query.lower()
+        query_words = query_lower.split()
+        if query_words and all(_TOKEN_RE.fullmatch(word) for word in query_words):
+            posting_sets = []
+            for word in query_words:
+                postings = set()
+                for token, concepts in self.token_index.items():
+                    if word in token:
+                        postings |= concepts
+                if not postings:
+                    # No label contains this word, so the "AND" can
+                    # never be satisfied.
+                    return []
+                posting_sets.append(postings)
+            return sorted(set.intersection(*posting_sets))
 
-        # Split the query into words for a more robust "AND" search
-        query_words = query.lower().split()
+        # Fallback: the original substring "AND" scan. Only reached when
+        # a query word carries non-alphanumeric characters (e.g.,
+        # 'non-current'): such a word can span a token boundary in the
+        # label text, so the token index above can't resolve it. O(N*M),
+        # but the charmask check rejects most labels with one int AND
+        # before any substring comparison happens.
+        query_mask = _charmask(query_lower)
+        label_charmask = self._label_charmask
         concepts_found = []
 
         for label_text_lower, concept in self.label_to_concept.items():
+            # Quick-reject: label is missing a letter the query needs
+            if query_mask & ~label_charmask[label_text_lower]:
+                continue
             # Check if all query words are in the label
-            # This is an O(N*M) operation (N labels, M query words)
-            # but is fast in practice for small M.
             if all(word in label_text_lower for word in query_words):
                 concepts_found.append(concept)
 
@@ -83,4 +206,4 @@ class LabelParser:
     def get_label_for_concept(self, concept):
         """Helper to get a clean label for a CSV row."""
         # Fallback to the concept name itself if no label was found
-        return self.concept_to_label.get(concept, concept)
+        return self.labels.get(concept, concept)
@@ -1,10 +1,8 @@
 import csv
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import pathlib
-import sys
 import re
-import json
-import xml.etree.ElementTree as ET
-from datetime import datetime
 
 # Use Decimal for high-precision financial math; float is insufficient
 # and will produce rounding errors with large figures.
@@ -14,6 +12,38 @@ from decimal import Decimal, getcontext, InvalidOperation
 # Set global precision for Decimal math. 38 is a safe, high-precision standard.
 getcontext().prec = 38
 
+# NumPy is optional: when available, the CSV scaling stage computes all
+# numeric cells in one vectorized pass instead of per-cell Decimal math.
+# Report magnitudes fit comfortably in a float64 mantissa, so this is safe;
+# without NumPy we fall back to the (slower) per-cell Decimal path.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Numba is equally optional: when present (alongside NumPy), the scaling
+# arithmetic runs as a single LLVM-compiled loop with no NumPy
+# temporaries, which matters on very large filings. Everyone else uses
+# the plain NumPy expression.
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+if np is not None and njit is not None:
+    @njit(cache=True)
+    def _scale_kernel(values, powers, negative):
+        out = np.empty_like(values)
+        for i in range(values.shape[0]):
+            scaled = values[i] * 10.0 ** powers[i]
+            out[i] = -scaled if negative[i] else scaled
+        return out
+else:
+    _scale_kernel = None
+
+# Compiled once: strips anything unsafe for a filename in _write_csv.
+_FILENAME_RE = re.compile(r'[^a-z0-9_]+')
+
 # Import the worker classes. This script acts as the orchestrator.
 from lab_parser import LabelParser
 from pre_parser import PresentationParser
@@ -23,6 +53,177 @@ from htm_parser import HtmParser
 # To filter subtotals, we'd import and use CalParser to build a
 # set of all parent concepts, which we could then check against.
 
+"""
+-------------------------------------------------------------------------------
+Section 1: Numeric Scaling Helpers
+-------------------------------------------------------------------------------
+"""
+
+
+@functools.lru_cache(maxsize=64)
+def _pow10(power):
+    """
+    Memoized Decimal(10) ** power.
+    Decimal exponentiation is by far the most expensive operation in the
+    scalar scaling path, and 'power' only takes a dozen or so distinct
+    values per filing (scale is usually 0/3/6, decimals -6/-3/0/2).
+    """
+    return Decimal(10) ** power
+
+
+def _get_scaled_numeric(cell):
+    """
+    This is the core numerical logic (scalar path).
+    Takes a (value, decimals, scale) cell tuple from HtmParser and
+    applies scale and decimals to the base value using Decimal math.
+    e.g., value=100, scale=6 -> 100,000,000
+    e.g., value=100, decimals=-3 (thousands) -> 100,000
+    """
+    value_str, decimals_str, scale_str = cell
+
+    if not value_str or value_str == 'N/A':
+        return 'N/A'  # Pass through 'N/A'
+
+    # Clean the string for Decimal conversion
+    cleaned_str = value_str.replace(',', '')
+    is_negative = False
+    # Handle standard accounting format for negatives
+    if cleaned_str.startswith('(') and cleaned_str.endswith(')'):
+        is_negative = True
+        cleaned_str = cleaned_str.strip('()')
+
+    try:
+        # 'INF' is a valid XBRL value for decimals, treat as 0
+        if decimals_str.lower() == 'inf':
+            decimals_str = '0'
+
+        scale = int(scale_str)
+        decimals = int(decimals_str)
+
+        # This logic is key:
+        # 'scale' is a multiplier (10^scale)
+        # 'decimals' is a *divider* (10^decimals), so we subtract
+        # A negative 'decimals' (e.g., -3 for thousands) becomes a multiplier
+        # Final value = base_value * (10 ** scale) * (10 ** -decimals)
+        # ...which simplifies to:
+        total_power = scale - decimals
+
+        # Fast path: a whole-number value scaled by a non-negative power
+        # stays a whole number, so plain (arbitrary-precision) int math
+        # gives the exact answer without touching Decimal at all.
+        if total_power >= 0 and '.' not in cleaned_str:
+            try:
+                base_int = int(cleaned_str)
+            except ValueError:
+                base_int = None  # e.g. '1e5'; let Decimal handle it
+            if base_int is not None:
+                final_value = base_int * 10 ** total_power
+                return -final_value if is_negative else final_value
+
+        # Use Decimal for high-precision math.
+        base_value = Decimal(cleaned_str)
+
+        # Apply the scaling (cached power-of-ten)
+        scaled_value = base_value * _pow10(total_power)
+
+        final_value = -scaled_value if is_negative else scaled_value
+
+        # Return as int if it's a whole number, else float
+        if final_value == final_value.to_integral_value():
+            return int(final_value)
+        else:
+            return float(final_value)
+
+    except (ValueError, TypeError, InvalidOperation):
+        # This block catches non-numeric text (e.g., "See Note 5")
+        # Truncate for cleaner CSV output
+        return (value_str[:75] + '...') if len(value_str) > 75 else value_str
+
+
+def _scale_cells(cells):
+    """
+    Scales a whole batch of (value, decimals, scale) cell tuples at once.
+    With NumPy available, all numeric cells are computed in a single
+    C-level multiply/power over three parallel arrays, which replaces
+    one Decimal construction + power + multiply per cell. Non-numeric
+    cells ('N/A', footnote text) keep the scalar path's behavior.
+    """
+    if np is None:
+        # No NumPy: scalar Decimal path for every cell
+        return [_get_scaled_numeric(cell) for cell in cells]
+
+    results = [None] * len(cells)
+    # Parallel lists for the numeric cells only
+    num_indices = []
+    num_values = []
+    num_powers = []
+    num_negative = []
+
+    for i, (value_str, decimals_str, scale_str) in enumerate(cells):
+        if not value_str or value_str == 'N/A':
+            results[i] = 'N/A'  # Pass through 'N/A'
+            continue
+
+        # Clean the string exactly like the scalar path
+        cleaned_str = value_str.replace(',', '')
+        is_negative = False
+        if cleaned_str.startswith('(') and cleaned_str.endswith(')'):
+            is_negative = True
+            cleaned_str = cleaned_str.strip('()')
+
+        try:
+            value = float(cleaned_str)
+
+            # 'INF' is a valid XBRL value for decimals, treat as 0
+            if decimals_str.lower() == 'inf':
+                decimals_str = '0'
+
+            total_power = int(scale_str) - int(decimals_str)
+        except (ValueError, TypeError):
+            # Non-numeric text (e.g., "See Note 5"): truncate like the
+            # scalar path does.
+            results[i] = (value_str[:75] + '...') if len(value_str) > 75 else value_str
+            continue
+
+        num_indices.append(i)
+        num_values.append(value)
+        num_powers.append(total_power)
+        num_negative.append(is_negative)
+
+    if num_indices:
+        count = len(num_indices)
+        values = np.fromiter(num_values, dtype=np.float64, count=count)
+        powers = np.fromiter(num_powers, dtype=np.float64, count=count)
+        negative = np.fromiter(num_negative, dtype=bool, count=count)
+
+        # One shot: sign * value * 10^(scale - decimals)
+        if _scale_kernel is not None:
+            # JIT-compiled loop, no intermediate arrays
+            scaled = _scale_kernel(values, powers, negative)
+        else:
+            scaled = np.where(negative, -values, values) * np.power(10.0, powers)
+
+        # Whole numbers come back as ints, like the scalar path.
+        # Non-integral results are squeezed through 15 significant digits
+        # to shed float64 representation noise (e.g. 0.011000000000000001),
+        # matching what the Decimal path would have produced.
+        # Values beyond float64 range come back as inf (which rint treats
+        # as integral, so int() on them would raise OverflowError); those
+        # cells take the exact per-cell Decimal path instead.
+        finite = np.isfinite(scaled)
+        integral = finite & (scaled == np.rint(scaled))
+        for i, value, is_int, is_finite in zip(
+                num_indices, scaled.tolist(), integral.tolist(), finite.tolist()):
+            if not is_finite:
+                results[i] = _get_scaled_numeric(cells[i])
+            elif is_int:
+                results[i] = int(value)
+            else:
+                results[i] = float(f'{value:.15g}')
+
+    return results
+
+
 """
 -------------------------------------------------------------------------------
 Section 2: The Main XbrlParser (The "Orchestrator")
@@ -48,9 +249,6 @@ class XbrlParser:
 
         # 1. Set paths
         self.htm_path = pathlib.Path(htm_file_path)
-        if not self.htm_path.is_file():
-            print(f"FATAL ERROR: File not found: {self.htm_path}")
-            sys.exit(1)
 
         # Infer component file paths based on the HTM file's prefix.
         # e.g., 'goog-20250331_htm.xml' -> base_prefix 'goog-20250331'
@@ -65,11 +263,14 @@ class XbrlParser:
         print(f"  [XbrlParser] Inferred LAB path: {self.lab_path.name}")
         print(f"  [XbrlParser] Inferred PRE path: {self.pre_path.name}")
 
-        # 2. Check all files
-        for f in [self.lab_path, self.pre_path]:
-            if not f.is_file():
-                print(f"FATAL ERROR: Inferred file not found: {f}")
-                sys.exit(1)
+        # 2. Check all files in one batch. Raise instead of sys.exit(1) so
+        # a caller looping over many filings can catch and skip a bad one
+        # without tearing down the interpreter.
+        missing = [p for p in (self.htm_path, self.lab_path, self.pre_path)
+                   if not p.is_file()]
+        if missing:
+            raise FileNotFoundError(
+                f"Missing XBRL file(s): {', '.join(str(p) for p in missing)}")
 
         # 3. Create dynamic output folder name based on path components
         # Assumes a structure like .../TICKER/PERIOD/filename.xml
@@ -82,50 +283,40 @@ class XbrlParser:
         self.output_dir.mkdir(exist_ok=True)
         print(f"  [XaParser] Output directory set to: {self.output_dir}")
 
-        # 4. Discover namespaces (critical step)
+        # 4. Namespace discovery (critical step)
         # Namespaces (e.g., 'us-gaap') are not consistent across filings,
-        # so we *must* discover them from the files themselves.
-        self.ns = self._discover_namespaces()
-        print(f"  [XbrlParser] Discovered {len(self.ns)} total namespaces.")
-        
+        # so we *must* discover them from the files themselves. Rather than
+        # pre-reading every file just for 'xmlns' declarations (which doubled
+        # I/O on large filings), we share one dict with the workers and each
+        # worker fills it in from 'start-ns' events during its own parse.
+        self.ns = {}
+
         # Set default fallbacks, as these are almost universal
         self.ns.setdefault('link', 'http://www.xbrl.org/2003/linkbase')
         self.ns.setdefault('xlink', 'http://www.w3.org/1999/xlink')
-        self.ns.setdefault('xbrli', 'http://www.xbrl.org/2003/instance')
 
         # 5. Create instances of component parsers (Dependency Injection)
-        # We pass the shared, discovered namespaces to each worker.
+        # We pass the shared namespace dict to each worker; each one adds
+        # the prefixes it encounters, so later workers (and queries) see
+        # everything discovered so far.
         self.lab_parser = LabelParser(self.lab_path, self.ns)
         self.pre_parser = PresentationParser(self.pre_path, self.ns)
         self.htm_parser = HtmParser(self.htm_path, self.ns)
 
-        print("--- Parser is ready ---")
+        # The 'xbrli' namespace (for <context> tags) is often the 'default'
+        # in the HTM file; HtmParser resolves that itself, but map it here
+        # too so the shared dict is complete for any later lookups.
+        if 'xbrli' not in self.ns and 'default' in self.ns:
+            self.ns['xbrli'] = self.ns['default']
+        self.ns.setdefault('xbrli', 'http://www.xbrl.org/2003/instance')
 
-    def _discover_namespaces(self):
-        """
-        Parses all XML files to find all 'xmlns' definitions.
-        This is robust, as namespaces can be defined in any file.
-        """
-        print("  [XbrlParser] Discovering namespaces (Robust Method)...")
-        namespaces = {}
-
-        # Iterate all relevant files
-        for xml_file in [self.lab_path, self.pre_path, self.htm_path]:
-            # iterparse is memory-efficient and finds 'start-ns' events
-            events = ET.iterparse(xml_file, events=['start-ns'])
-            for event, (prefix, uri) in events:
-                if prefix:
-                    namespaces[prefix] = uri
-                else:
-                    # 'default' namespace (no prefix)
-                    namespaces['default'] = uri
+        print(f"  [XbrlParser] Discovered {len(self.ns)} total namespaces.")
 
-        # The 'xbrli' namespace (for <context> tags) is often the 'default'
-        # in the HTM file, so we map it explicitly.
-        if 'xbrli' not in namespaces and 'default' in namespaces:
-            namespaces['xbrli'] = namespaces['default']
+        # Cache of resolved context IDs per (type, count); queries of the
+        # same type share the same contexts, so resolve each type once.
+        self._context_cache = {}
 
-        return namespaces
+        print("--- Parser is ready ---")
 
     def _find_relevant_contexts(self, query, num_contexts=2):
         """
@@ -142,82 +333,101 @@ class XbrlParser:
             # Concepts on income/cash flow are "over a period"
             target_type = 'duration'
 
+        # Queries of the same type always resolve to the same contexts, so
+        # the scan+sort below only runs once per (type, count) pair and
+        # every later query reuses the result.
+        cached = self._context_cache.get((target_type, num_contexts))
+        if cached is not None:
+            print(f"    ...Query type is '{target_type}'. Reusing contexts: {cached}")
+            return cached
+
         print(f"    ...Query type is '{target_type}'. Finding most recent contexts...")
 
-        # Get the pre-parsed contexts from the HtmParser
-        all_contexts = self.htm_parser.contexts
-        filtered_contexts = []
-        for ctx_id, info in all_contexts.items():
-            if info.get('type') == target_type:
-                filtered_contexts.append({'id': ctx_id, 'date': info['date']})
+        # Walk the pre-sorted (date, context_id) list from the HtmParser
+        # (built once at init, newest first) instead of re-scanning and
+        # re-sorting all contexts per query.
+        sorted_contexts = self.htm_parser.get_sorted_contexts(target_type)
 
-        if not filtered_contexts:
+        if not sorted_contexts:
             print(f"    ...WARNING: No contexts found for type '{target_type}'.")
             return []
 
-        # Helper to parse ISO format dates for sorting
-        def safe_date_parse(c):
-            return datetime.fromisoformat(c['date'])
-
-        # Sort by date, newest first
-        filtered_contexts.sort(key=safe_date_parse, reverse=True)
-
         # De-duplicate by date. We only want the *most recent* contexts,
         # as filings often have multiple contexts for the same date
         # (e.g., one with dimensions, one without). This gets the top N unique dates.
         top_contexts = []
         seen_dates = set()
-        for ctx in filtered_contexts:
-            if ctx['date'] not in seen_dates:
-                top_contexts.append(ctx['id'])
-                seen_dates.add(ctx['date'])
+        for date, ctx_id in sorted_contexts:
+            if date not in seen_dates:
+                top_contexts.append(ctx_id)
+                seen_dates.add(date)
             # Stop once we have the number of contexts we need
             if len(top_contexts) >= num_contexts:
                 break
 
         print(f"    ...Found contexts: {top_contexts}")
+        self._context_cache[(target_type, num_contexts)] = top_contexts
         return top_contexts
 
     def parse(self, query_list):
         """
         The main public method. Processes a list of mixed queries.
         This orchestrates the entire workflow.
+        Queries are independent reads against the already-cached worker
+        data, each writing its own CSV, so they run concurrently on a
+        small thread pool (CSV I/O releases the GIL; the rest is mostly
+        dict lookups).
         """
         print(f"\n--- Starting to Parse {len(query_list)} Queries ---")
 
-        for query in query_list:
-            print(f"\n  Processing Query: '{query}'")
+        if not query_list:
+            # Nothing to do; also keeps ThreadPoolExecutor from choking
+            # on max_workers=0.
+            print("\n--- All Parsing Complete ---")
+            return
+
+        with ThreadPoolExecutor(max_workers=min(8, len(query_list))) as executor:
+            # list() drains the iterator so worker exceptions propagate
+            list(executor.map(self._process_query, query_list))
+
+        print("\n--- All Parsing Complete ---")
+
+    def _process_query(self, query):
+        """
+        Runs the full workflow for a single query.
+        Only touches worker state that is read-only after construction,
+        so it is safe to call from multiple threads.
+        """
+        print(f"\n  Processing Query: '{query}'")
 
-            # 1. Try to find concepts as a "Statement" (from pre_parser)
-            # This returns an ordered list if it's a known statement.
-            concept_path = self.pre_parser.find_statement_concepts(query)
+        # 1. Try to find concepts as a "Statement" (from pre_parser)
+        # This returns an ordered list if it's a known statement.
+        concept_path = self.pre_parser.find_statement_concepts(query)
 
-            # 2. If not a statement, search labels (from lab_parser)
-            # This returns a list of one or more matching concepts.
-            if not concept_path:
-                print(f"    ...Not a statement. Searching labels...")
-                concept_path = self.lab_parser.find_concepts_by_query(query)
+        # 2. If not a statement, search labels (from lab_parser)
+        # This returns a list of one or more matching concepts.
+        if not concept_path:
+            print(f"    ...Not a statement. Searching labels...")
+            concept_path = self.lab_parser.find_concepts_by_query(query)
 
-            # 3. If no path found, warn and skip
-            if not concept_path:
-                print(f"    ...WARNING: No concepts found for query '{query}'. Skipping.")
-                continue
+        # 3. If no path found, warn and skip
+        if not concept_path:
+            print(f"    ...WARNING: No concepts found for query '{query}'. Skipping.")
+            return
 
-            print(f"    ...Found {len(concept_path)} concepts for this query.")
+        print(f"    ...Found {len(concept_path)} concepts for this query.")
 
-            # 4. Find relevant time contexts (from htm_parser)
-            context_ids = self._find_relevant_contexts(query)
-            if not context_ids:
-                print(f"    ...WARNING: Could not find relevant contexts for '{query}'. Skipping.")
-                continue
+        # 4. Find relevant time contexts (from htm_parser)
+        context_ids = self._find_relevant_contexts(query)
+        if not context_ids:
+            print(f"    ...WARNING: Could not find relevant contexts for '{query}'. Skipping.")
+            return
 
-            # 5. Get the actual financial data (from htm_parser)
-            data_rows = self.htm_parser.get_data(concept_path, context_ids)
-            
-            # 6. Write to CSV
-            self._write_csv(query, data_rows, context_ids)
+        # 5. Get the actual financial data (from htm_parser)
+        data_rows = self.htm_parser.get_data(concept_path, context_ids)
 
-        print("\n--- All Parsing Complete ---")
+        # 6. Write to CSV
+        self._write_csv(query, data_rows, context_ids)
 
     def _write_csv(self, query, data_rows, context_ids):
         """
@@ -226,94 +436,46 @@ class XbrlParser:
         """
 
         # Sanitize query to create a valid filename
-        filename = re.sub(r'[^a-z0-9_]+', '', query.lower().replace(' ', '_')) + '.csv'
+        filename = _FILENAME_RE.sub('', query.lower().replace(' ', '_')) + '.csv'
         output_path = self.output_dir / filename
 
         # Get date headers (e.g., '2025-03-31') from context IDs (e.g., 'c-123')
         date_headers = self.htm_parser.get_context_dates(context_ids)
         header = ['Line Item'] + date_headers
 
-        def _get_scaled_numeric(value_obj):
-            """
-            This is the core numerical logic.
-            Applies scale and decimals to the base value using Decimal math.
-            e.g., value=100, scale=6 -> 100,000,000
-            e.g., value=100, decimals=-3 (thousands) -> 100,000
-            """
-            value_str = value_obj.get('value')
-
-            if not value_str or value_str == 'N/A':
-                return 'N/A'  # Pass through 'N/A'
-
-            # Clean the string for Decimal conversion
-            cleaned_str = value_str.replace(',', '')
-            is_negative = False
-            # Handle standard accounting format for negatives
-            if cleaned_str.startswith('(') and cleaned_str.endswith(')'):
-                is_negative = True
-                cleaned_str = cleaned_str.strip('()')
-
-            try:
-                # Use Decimal for high-precision math.
-                base_value = Decimal(cleaned_str)
-
-                # Get scale/decimals, defaulting to '0' if not provided
-                scale_str = value_obj.get('scale', '0')
-                decimals_str = value_obj.get('decimals', '0')
-
-                # 'INF' is a valid XBRL value for decimals, treat as 0
-                if decimals_str.lower() == 'inf':
-                    decimals_str = '0'
-
-                scale = int(scale_str)
-                decimals = int(decimals_str)
-
-                # This logic is key:
-                # 'scale' is a multiplier (10^scale)
-                # 'decimals' is a *divider* (10^decimals), so we subtract
-                # A negative 'decimals' (e.g., -3 for thousands) becomes a multiplier
-                # Final value = base_value * (10 ** scale) * (10 ** -decimals)
-                # ...which simplifies to:
-                total_power = scale - decimals
-                
-                # Apply the scaling
-                scaled_value = base_value * (Decimal(10) ** total_power)
-
-                final_value = -scaled_value if is_negative else scaled_value
-
-                # Return as int if it's a whole number, else float
-                if final_value == final_value.to_integral_value():
-                    return int(final_value)
-                else:
-                    return float(final_value)
-
-            except (ValueError, TypeError, InvalidOperation):
-                # This block catches non-numeric text (e.g., "See Note 5")
-                # Truncate for cleaner CSV output
-                return (value_str[:75] + '...') if len(value_str) > 75 else value_str
+        # Collect every cell (row-major) so the whole table can be scaled
+        # in one vectorized pass rather than cell-by-cell.
+        cells = []
+        for data in data_rows:
+            for ctx_id in context_ids:
+                cells.append(data.get(ctx_id))
+        scaled_cells = _scale_cells(cells)
+
+        # Materialize all rows first, then emit them with one writerows
+        # call; csv's per-writerow dispatch adds up over hundreds of rows.
+        rows = [header]
+        num_ctx = len(context_ids)
+        # Direct reference to the label table: one dict.get per row
+        # instead of a method call into the LabelParser.
+        labels = self.lab_parser.labels
+        for i, data in enumerate(data_rows):
+            # ---
+            # NOTE: NO FILTERING LOGIC
+            # This is where we would check against a CalParser index
+            # if data['concept'] in self.cal_parser.parent_concepts:
+            #     continue
+            # ---
+
+            # Get the human-readable label (e.g., "Revenues"), falling
+            # back to the concept name itself
+            concept = data['concept']
+            label = labels.get(concept, concept)
+
+            # Stitch the label to this row's slice of the scaled cells
+            rows.append([label] + scaled_cells[i * num_ctx:(i + 1) * num_ctx])
 
         with open(output_path, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(header)
-
-            for data in data_rows:
-                # ---
-                # NOTE: NO FILTERING LOGIC
-                # This is where we would check against a CalParser index
-                # if data['concept'] in self.cal_parser.parent_concepts:
-                #     continue
-                # ---
-
-                # Get the human-readable label (e.g., "Revenues")
-                label = self.lab_parser.get_label_for_concept(data['concept'])
-                row = [label]
-
-                # Append the scaled numeric value for each context
-                for ctx_id in context_ids:
-                    value_object = data.get(ctx_id)
-                    row.append(_get_scaled_numeric(value_object))
-
-                writer.writerow(row)
+            csv.writer(f).writerows(rows)
 
         print(f"    ...Success! File '{filename}' created.")
 
@@ -1,5 +1,20 @@
-import xml.etree.ElementTree as ET
 import collections
+import re
+import sys
+
+# lxml's libxml2-backed parser tokenizes multi-MB linkbase files several
+# times faster than the stdlib ElementTree wrapper; the APIs used here
+# (iterparse, .iter, .get) are drop-in compatible. Fall back to the
+# stdlib when lxml isn't installed so the dependency stays optional.
+try:
+    from lxml import etree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+# Splits a role's friendly name on CamelCase boundaries, so
+# "CondensedConsolidatedBalanceSheets" yields
+# ['Condensed', 'Consolidated', 'Balance', 'Sheets'].
+_CAMEL_RE = re.compile(r'[A-Za-z][a-z0-9]*')
 
 
 class PresentationParser:
@@ -15,8 +30,39 @@ class PresentationParser:
         self.ns = namespaces  # Get namespaces from orchestrator
         self.pre_path = pre_path
         self.discovered_roles = {}  # Map: {friendly_name: role_uri}
-        self.tree_pre = ET.parse(self.pre_path)
-        self.root_pre = self.tree_pre.getroot()
+
+        # Parse the file once, harvesting 'xmlns' declarations into the
+        # shared namespace dict as we go (no separate discovery pass).
+        events = ET.iterparse(self.pre_path, events=('start-ns', 'end'))
+        for event, payload in events:
+            if event == 'start-ns':
+                prefix, uri = payload
+                # 'default' namespace (no prefix)
+                self.ns[prefix if prefix else 'default'] = uri
+        self.root_pre = events.root
+
+        # Namespaced tag/attribute strings, built once instead of being
+        # re-concatenated inside every loop and every query call.
+        # Interned so the per-element tag comparisons and attribute dict
+        # probes they key get the pointer-equality fast path.
+        self._role_ref_tag = sys.intern('{' + self.ns['link'] + '}roleRef')
+        self._prez_link_tag = sys.intern('{' + self.ns['link'] + '}presentationLink')
+        self._loc_tag = sys.intern('{' + self.ns['link'] + '}loc')
+        self._arc_tag = sys.intern('{' + self.ns['link'] + '}presentationArc')
+        self._href_attr = sys.intern('{' + self.ns['xlink'] + '}href')
+        self._label_attr = sys.intern('{' + self.ns['xlink'] + '}label')
+        self._role_attr = sys.intern('{' + self.ns['xlink'] + '}role')
+        self._from_attr = sys.intern('{' + self.ns['xlink'] + '}from')
+        self._to_attr = sys.intern('{' + self.ns['xlink'] + '}to')
+
+        # Cache of role URI -> ordered concept list. Different query
+        # strings can resolve to the same statement; the graph build and
+        # traversal below only need to happen once per role.
+        self._path_cache = {}
+        # Per-instance query -> result memo. A dict owned by the instance
+        # (rather than lru_cache on the method, which keys a class-level
+        # cache on self) dies with the parser instead of pinning it alive.
+        self._query_cache = {}
 
         # Build the index of available statements on initialization
         self._discover_roles()
@@ -27,15 +73,36 @@ class PresentationParser:
         e.g., "role_condensedconsolidatedbalancesheets" -> "http://.../role/..."
         This lets us query by friendly name (e.g., "balance sheet").
         """
-        role_ref_tag = '{' + self.ns['link'] + '}roleRef'
-        for role_ref in self.root_pre.iter(role_ref_tag):
+        # Inverted index: lowercase CamelCase token -> set of role URIs,
+        # plus the discovery order of each role so multi-match queries
+        # still resolve to the same statement the old first-match scan
+        # chose.
+        self._role_token_index = collections.defaultdict(set)
+        self._role_order = {}
+
+        for role_ref in self.root_pre.iter(self._role_ref_tag):
             role_uri = role_ref.get('roleURI')
-            href = role_ref.get('{' + self.ns['xlink'] + '}href')
+            href = role_ref.get(self._href_attr)
             if role_uri and href and '#' in href:
                 # The 'href' contains a path to a schema file, ending
                 # with an ID that serves as the friendly name.
-                friendly_name = href.split('#')[-1]
+                # rpartition skips the list allocation split() would make.
+                friendly_name = href.rpartition('#')[2]
                 self.discovered_roles[friendly_name.lower()] = role_uri
+                self._role_order.setdefault(role_uri, len(self._role_order))
+                for token in _CAMEL_RE.findall(friendly_name):
+                    self._role_token_index[token.lower()].add(role_uri)
+
+        # Index the <presentationLink> elements by their role URI so
+        # find_statement_concepts can fetch one directly instead of
+        # scanning the root's children per query.
+        self._link_by_role = {}
+        for child in self.root_pre:
+            if child.tag == self._prez_link_tag:
+                link_role = child.get(self._role_attr)
+                if link_role and link_role not in self._link_by_role:
+                    self._link_by_role[link_role] = child
+
         print(f"  [PresentationParser] Discovered {len(self.discovered_roles)} roles.")
 
     def find_statement_concepts(self, query):
@@ -43,33 +110,61 @@ class PresentationParser:
         This is the "path finder" for statements.
         It finds the matching statement, builds its graph of concepts,
         and performs a DFS to return the ordered list of concepts.
+        Results are memoized per query string; the presentation tree never
+        changes after init, so repeat queries skip the graph walk.
         """
-
-        # Split the query into words for a more robust "AND" search
+        cached = self._query_cache.get(query)
+        if cached is None:
+            cached = self._query_cache[query] = self._resolve_statement(query)
+        return cached
+
+    def _resolve_statement(self, query):
+        # Split the query into words for a more robust "AND" search,
+        # resolved against the role token index: each word keeps the roles
+        # whose name has a token starting with it ('sheet' matches both
+        # 'Sheet' and 'Sheets'), and the candidate sets are intersected.
+        # Queries that aren't statements die on their first unknown word
+        # instead of substring-scanning every role name.
         query_words = query.lower().split()
 
-        role_uri = None
-        for friendly_name_lower, uri in self.discovered_roles.items():
-            # Check if all query words are in the friendly name
-            if all(word in friendly_name_lower for word in query_words):
-                role_uri = uri
+        candidates = None
+        for word in query_words:
+            # Union every token the word is a prefix of, exact match
+            # included. An exact token must not short-circuit the prefix
+            # expansion: with both 'sheet' and 'sheets' in the index,
+            # stopping at 'sheet' would drop the roles only 'sheets'
+            # reaches and break the intersection.
+            postings = set()
+            for token, roles in self._role_token_index.items():
+                if token.startswith(word):
+                    postings |= roles
+            if not postings:
+                candidates = None
                 break
+            candidates = postings if candidates is None else candidates & postings
+            if not candidates:
+                candidates = None
+                break
+
+        if candidates:
+            # Same tie-break as the old linear scan: first discovered wins
+            role_uri = min(candidates, key=self._role_order.__getitem__)
+        else:
+            role_uri = None
 
         if role_uri is None:
             return []  # This query is not a statement, return empty list.
 
-        print(f"    ...Found matching statement. Getting order for {role_uri}...")
+        # Serve an already-built path for this role if we have one
+        cached_path = self._path_cache.get(role_uri)
+        if cached_path is not None:
+            return cached_path
 
-        # 1. Find the specific <presentationLink> for the matched role
-        presentation_link = None
-        expected_tag = '{' + self.ns['link'] + '}presentationLink'
-        expected_attr_key = '{' + self.ns['xlink'] + '}role'
+        print(f"    ...Found matching statement. Getting order for {role_uri}...")
 
-        # Iterate root elements to find the one matching our role
-        for child in self.root_pre:
-            if child.tag == expected_tag and child.get(expected_attr_key) == role_uri:
-                presentation_link = child
-                break
+        # 1. Fetch the <presentationLink> for the matched role from the
+        # index built during _discover_roles
+        presentation_link = self._link_by_role.get(role_uri)
 
         if presentation_link is None:
             return [] # Should not happen if role was found, but good practice.
@@ -77,19 +172,19 @@ class PresentationParser:
         # 2. Build a <loc> to concept map (like in LabelParser, but local)
         # This map is local to *only* this presentationLink.
         loc_to_concept = {}
-        for loc in presentation_link.iter('{' + self.ns['link'] + '}loc'):
-            href = loc.get('{' + self.ns['xlink'] + '}href')
-            label = loc.get('{' + self.ns['xlink'] + '}label')
+        for loc in presentation_link.iter(self._loc_tag):
+            href = loc.get(self._href_attr)
+            label = loc.get(self._label_attr)
             if href and label and '#' in href:
-                loc_to_concept[label] = href.split('#')[-1]  # "us-gaap_Assets"
+                loc_to_concept[label] = href.rpartition('#')[2]  # "us-gaap_Assets"
 
         # 3. Build the graph (adjacency list)
         # We store 'from_loc' -> list of ('order', 'to_loc')
         arcs = collections.defaultdict(list)
         all_to_locs = set() # Used to find root nodes
-        for arc in presentation_link.iter('{' + self.ns['link'] + '}presentationArc'):
-            from_loc = arc.get('{' + self.ns['xlink'] + '}from')
-            to_loc = arc.get('{' + self.ns['xlink'] + '}to')
+        for arc in presentation_link.iter(self._arc_tag):
+            from_loc = arc.get(self._from_attr)
+            to_loc = arc.get(self._to_attr)
             # The 'order' attribute is critical for sorting
             order = float(arc.get('order', 1.0))
             if from_loc and to_loc and to_loc in loc_to_concept:
@@ -101,19 +196,30 @@ class PresentationParser:
         root_locs = [loc for loc in arcs if loc not in all_to_locs]
         ordered_concepts = []
 
-        # 5. Perform a Depth-First Search (DFS) to get the ordered list
-        def dfs_sort(loc_id):
-            """Recursive DFS to traverse the statement graph."""
+        # Sort each adjacency list by the 'order' attribute once, then
+        # drop the keys: after this point only the child order matters,
+        # so the traversal handles bare loc ids without tuple unpacking.
+        for from_loc, children in arcs.items():
+            children.sort()
+            arcs[from_loc] = [to_loc for _, to_loc in children]
+
+        # 5. Depth-first traversal with an explicit stack to get the
+        # ordered list. Deep statements (balance sheets with many subtotal
+        # groups) made the old recursive version pay a Python frame per
+        # node; the stack version is one loop. Children are pushed in
+        # reverse so they pop in 'order' order.
+        stack = list(reversed(root_locs))
+        append_concept = ordered_concepts.append
+        while stack:
+            loc_id = stack.pop()
             concept = loc_to_concept.get(loc_id)
             if concept:
-                ordered_concepts.append(concept)
-            
-            # Sort children by their 'order' attribute before traversing
-            for order, child_loc_id in sorted(arcs.get(loc_id, [])):
-                dfs_sort(child_loc_id)
+                append_concept(concept)
 
-        # Start the DFS from all root nodes
-        for root_loc in root_locs:
-            dfs_sort(root_loc)
+            children = arcs.get(loc_id)
+            if children:
+                for child_loc_id in reversed(children):
+                    stack.append(child_loc_id)
 
+        self._path_cache[role_uri] = ordered_concepts
         return ordered_concepts  # This is the final, ordered "path"